@@ -1,7 +1,7 @@
 import json
 
-from psycopg import Connection, Cursor, connect, Error, sql
-from datetime import datetime
+from psycopg import Connection, Cursor, connect, errors, Error, sql
+from datetime import date, datetime, timedelta
 from psycopg.rows import dict_row
 from dotenv import dotenv_values
 
@@ -23,6 +23,15 @@ CONNECTION_CONFIG = {
 
 DB_NAME = dotenv_values('.env')['DB_NAME']
 DEFAULT_DB_NAME = "postgres"
+# directory with the json files used to populate a fresh database,
+# can be pointed at a generated catalog (see benchmarks/generate_data.py)
+SAMPLE_DATA_DIR = dotenv_values('.env').get(
+    'SAMPLE_DATA_DIR', "/code/app/sample_data")
+
+# how long a book can be kept before the loan counts as overdue
+LOAN_PERIOD = timedelta(days=30)
+# how many monthly loans partitions are kept ready ahead of the current month
+LOANS_PARTITIONS_AHEAD = 3
 
 
 def database_init(cur: Cursor, conn: Connection) -> None:
@@ -116,7 +125,7 @@ def database_init(cur: Cursor, conn: Connection) -> None:
 
     # populate the table with sample branches data from branches.json
     print(f"Populating table {DB_NAME}.branches with sample data...")
-    with open("/code/app/sample_data/branches.json", "r") as f:
+    with open(f"{SAMPLE_DATA_DIR}/branches.json", "r") as f:
         branches = json.load(f)
         for branch in branches:
             cur.execute(sql.SQL("""INSERT INTO branches (name, location) 
@@ -127,7 +136,7 @@ def database_init(cur: Cursor, conn: Connection) -> None:
 
     # populate the table with sample users data from users.json
     print(f"Populating table {DB_NAME}.users with sample data...")
-    with open("/code/app/sample_data/users.json", "r") as f:
+    with open(f"{SAMPLE_DATA_DIR}/users.json", "r") as f:
         users = json.load(f)
         for user in users:
             cur.execute(sql.SQL("""INSERT INTO users (username, email, name, surname, is_admin, is_disabled, password) 
@@ -138,7 +147,7 @@ def database_init(cur: Cursor, conn: Connection) -> None:
 
     # populate the table with sample books data from books.json
     print(f"Populating table {DB_NAME}.books with sample data...")
-    with open("/code/app/sample_data/books.json", "r") as f:
+    with open(f"{SAMPLE_DATA_DIR}/books.json", "r") as f:
         books = json.load(f)
         for book in books:
             cur.execute(sql.SQL("""INSERT INTO books (title, author, year, isbn, branch, is_borrowed, date_borrowed, borrowed_by) 
@@ -178,6 +187,140 @@ conn = connection()
 cur = conn.cursor()
 
 
+# Loans history -----------------------------------------
+
+
+def _month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _loans_partition_name(month: date) -> str:
+    return f"loans_{month:%Y_%m}"
+
+
+def loans_init() -> None:
+    # runs on every startup so databases created before loans existed get them too
+    cur.execute(sql.SQL("""CREATE TABLE IF NOT EXISTS loans (
+                        id BIGSERIAL,
+                        book_id INTEGER NOT NULL,
+                        user_id INTEGER NOT NULL,
+                        borrowed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                        due_at TIMESTAMP NOT NULL,
+                        returned_at TIMESTAMP DEFAULT NULL,
+                        PRIMARY KEY (id, borrowed_at)
+                        ) PARTITION BY RANGE (borrowed_at);"""))
+    # indexes created on the parent are created on every partition as well,
+    # open loans are a tiny fraction of the history so they get partial indexes
+    cur.execute(sql.SQL(
+        "CREATE INDEX IF NOT EXISTS loans_open_due_at_idx ON loans (due_at) WHERE returned_at IS NULL;"))
+    cur.execute(sql.SQL(
+        "CREATE INDEX IF NOT EXISTS loans_open_book_id_idx ON loans (book_id) WHERE returned_at IS NULL;"))
+    cur.execute(sql.SQL(
+        "CREATE INDEX IF NOT EXISTS loans_user_id_borrowed_at_id_idx ON loans (user_id, borrowed_at DESC, id DESC);"))
+
+    # books borrowed without a matching open loan (sample data, borrows made
+    # before loans existed) get one, so returning them closes it properly
+    cur.execute(sql.SQL("""SELECT MIN(COALESCE(date_borrowed, CURRENT_DATE)) AS since
+                        FROM books WHERE is_borrowed AND borrowed_by IS NOT NULL;"""))
+    ensure_loans_partitions(cur.fetchone()["since"])
+    cur.execute(sql.SQL("""INSERT INTO loans (book_id, user_id, borrowed_at, due_at)
+                        SELECT id, borrowed_by, COALESCE(date_borrowed, CURRENT_DATE),
+                               COALESCE(date_borrowed, CURRENT_DATE) + %s
+                        FROM books
+                        WHERE is_borrowed AND borrowed_by IS NOT NULL AND NOT EXISTS (
+                            SELECT 1 FROM loans WHERE loans.book_id = books.id AND loans.returned_at IS NULL
+                        );"""), (LOAN_PERIOD,))
+    if cur.rowcount > 0:
+        print(f"Backfilled {cur.rowcount} open loans from {DB_NAME}.books")
+
+
+def create_loans_partition(month: date) -> None:
+    start = _month_start(month)
+    cur.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF loans FOR VALUES FROM ({}) TO ({});").format(
+        sql.Identifier(_loans_partition_name(start)), sql.Literal(start), sql.Literal(_next_month(start))))
+
+
+def ensure_loans_partitions(since: date | None = None) -> None:
+    # there is no default partition on purpose, it would have to be scanned every
+    # time a new month is attached, so the months ahead are created upfront instead
+    # (on startup, by app.retention and by borrow_book when one is missing)
+    month = _month_start(since if since else date.today())
+    last = _month_start(date.today())
+    for _ in range(LOANS_PARTITIONS_AHEAD):
+        last = _next_month(last)
+    while month <= last:
+        create_loans_partition(month)
+        month = _next_month(month)
+
+
+def get_loans_partitions() -> list[tuple[date, str, bool]]:
+    # the flag marks partitions left in the "detach pending" state by an interrupted detach
+    cur.execute(sql.SQL("""SELECT child.relname, pg_inherits.inhdetachpending FROM pg_inherits
+                        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                        WHERE pg_inherits.inhparent = 'loans'::regclass;"""))
+    partitions = []
+    for row in cur.fetchall():
+        name = row["relname"]
+        try:
+            month = datetime.strptime(name, "loans_%Y_%m").date()
+        except ValueError:
+            continue
+        partitions.append((month, name, row["inhdetachpending"]))
+    partitions.sort()
+    return partitions
+
+
+def detach_old_loans_partitions(retain_months: int, drop: bool = False) -> list[str]:
+    # partitions which ended before the cutoff month are detached as a whole,
+    # which is a catalog operation instead of deleting millions of rows
+    cutoff = _month_start(date.today())
+    for _ in range(retain_months):
+        cutoff = _month_start(cutoff - timedelta(days=1))
+
+    detached = []
+    for month, name, detach_pending in get_loans_partitions():
+        if _next_month(month) > cutoff:
+            continue
+        cur.execute(sql.SQL("SELECT 1 FROM {} WHERE returned_at IS NULL LIMIT 1;").format(
+            sql.Identifier(name)))
+        if cur.fetchone():
+            print(f"Partition {name} still has open loans, skipping")
+            continue
+        try:
+            if detach_pending:
+                cur.execute(sql.SQL("ALTER TABLE loans DETACH PARTITION {} FINALIZE;").format(
+                    sql.Identifier(name)))
+            else:
+                # CONCURRENTLY does not block borrow/return, needs autocommit
+                cur.execute(sql.SQL("ALTER TABLE loans DETACH PARTITION {} CONCURRENTLY;").format(
+                    sql.Identifier(name)))
+        except Error as e:
+            print(f"Error detaching partition {name}: {e}")
+            continue
+        print(f"Partition {name} detached successfully")
+        detached.append(name)
+
+        if drop:
+            try:
+                cur.execute(sql.SQL("DROP TABLE {};").format(
+                    sql.Identifier(name)))
+            except Error as e:
+                print(f"Error dropping detached partition {name}: {e}")
+            else:
+                print(f"Partition {name} dropped successfully")
+    return detached
+
+
+try:
+    loans_init()
+except Error as e:
+    print(f"Error initializing loans: {e}")
+
+
 # Books operations -----------------------------------------
 
 
@@ -239,22 +382,46 @@ def delete_book(book_id) -> bool:
         return True
 
 
+def _borrow_book(book_id, user_id) -> dict | None:
+    # one statement, so it runs atomically on the shared autocommit connection
+    cur.execute(sql.SQL("""WITH borrowed AS (
+                            UPDATE books SET is_borrowed = TRUE, borrowed_by = %s, date_borrowed = CURRENT_DATE
+                            WHERE id = %s AND NOT is_borrowed RETURNING id, borrowed_by
+                        )
+                        INSERT INTO loans (book_id, user_id, due_at)
+                        SELECT id, borrowed_by, CURRENT_TIMESTAMP + %s FROM borrowed RETURNING id;"""),
+                (user_id, book_id, LOAN_PERIOD))
+    return cur.fetchone()
+
+
 def borrow_book(book_id, user_id) -> bool:
     try:
-        cur.execute(sql.SQL(
-            "UPDATE books SET is_borrowed = TRUE, borrowed_by = %s WHERE id = %s;"), (user_id, book_id))
+        try:
+            loan = _borrow_book(book_id, user_id)
+        except errors.CheckViolation:
+            # no partition for this month, the server outlived the ones created on startup
+            print("Missing loans partition, creating it...")
+            ensure_loans_partitions(date.today() - timedelta(days=1))
+            loan = _borrow_book(book_id, user_id)
     except Error as e:
         print(f"Error borrowing book: {e}")
         return False
-    else:
-        print(f"Book id={book_id} borrowed by user={user_id} successfully")
-        return True
+    if not loan:
+        print(f"Book id={book_id} is already borrowed")
+        return False
+    print(f"Book id={book_id} borrowed by user={user_id} successfully")
+    return True
 
 
 def return_book(book_id) -> bool:
     try:
-        cur.execute(sql.SQL(
-            "UPDATE books SET is_borrowed = FALSE, borrowed_by = NULL WHERE id = %s;"), (str(book_id),))
+        cur.execute(sql.SQL("""WITH returned AS (
+                                UPDATE books SET is_borrowed = FALSE, borrowed_by = NULL, date_borrowed = NULL
+                                WHERE id = %s RETURNING id
+                            )
+                            UPDATE loans SET returned_at = CURRENT_TIMESTAMP FROM returned
+                            WHERE loans.book_id = returned.id AND loans.returned_at IS NULL;"""),
+                    (book_id,))
     except Error as e:
         print(f"Error returning book: {e}")
         return False
@@ -269,6 +436,34 @@ def get_user_books(user_id) -> list[schemas.Book]:
     books = cur.fetchall()
     return books
 
+# Loans operations -----------------------------------------
+
+
+def get_overdue_loans(limit: int = 100) -> list[schemas.Loan]:
+    # matches the partial index on open loans in every partition
+    cur.execute(sql.SQL("""SELECT * FROM loans
+                        WHERE returned_at IS NULL AND due_at < CURRENT_TIMESTAMP
+                        ORDER BY due_at LIMIT %s;"""), (limit,))
+    loans = cur.fetchall()
+    return loans
+
+
+def get_user_loans(user_id: int, before: datetime | None = None, before_id: int | None = None, limit: int = 100) -> list[schemas.Loan]:
+    # pages through the history newest first, `before` and `before_id` are
+    # borrowed_at and id of the last loan seen, id breaks ties of borrowed_at
+    if before and before_id is not None:
+        cur.execute(sql.SQL("""SELECT * FROM loans WHERE user_id = %s
+                            AND borrowed_at <= %s AND (borrowed_at, id) < (%s, %s)
+                            ORDER BY borrowed_at DESC, id DESC LIMIT %s;"""), (user_id, before, before, before_id, limit))
+    elif before:
+        cur.execute(sql.SQL("""SELECT * FROM loans WHERE user_id = %s AND borrowed_at < %s
+                            ORDER BY borrowed_at DESC, id DESC LIMIT %s;"""), (user_id, before, limit))
+    else:
+        cur.execute(sql.SQL("""SELECT * FROM loans WHERE user_id = %s
+                            ORDER BY borrowed_at DESC, id DESC LIMIT %s;"""), (user_id, limit))
+    loans = cur.fetchall()
+    return loans
+
 # Branches operations -----------------------------------------
 
 
@@ -1,14 +1,14 @@
 from typing import Union, Annotated
-from datetime import timedelta
+from datetime import datetime, timedelta
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import dotenv_values
 
 from . import database
 from . import auth
-from .schemas import Book, BookAdd, Token, User, UserAdd, Branch, BranchAdd
+from .schemas import Book, BookAdd, Token, User, UserAdd, Branch, BranchAdd, Loan
 
 app = FastAPI()
 
@@ -137,6 +137,28 @@ def return_book(book_id: int) -> bool:
         raise HTTPException(status_code=404, detail="Book not found")
     return database.return_book(book_id)
 
+# Loan endpoints -----------------------------------------
+
+
+@app.get("/loans/overdue/", tags=["Loans"])
+def get_overdue_loans(limit: int = Query(100, ge=1, le=1000), token: str = Depends(oauth2_scheme)) -> list[Loan]:
+    user = auth.get_current_user(token)
+    if not user.is_admin:
+        raise HTTPException(
+            status_code=403, detail="You are not an admin", headers={"WWW-Authenticate": "Bearer"}
+        )
+    return database.get_overdue_loans(limit)
+
+
+@app.get("/users/{user_id}/loans/", tags=["Loans"])
+def get_user_loans(user_id: int, before: datetime | None = None, before_id: int | None = None, limit: int = Query(100, ge=1, le=1000), token: str = Depends(oauth2_scheme)) -> list[Loan]:
+    user = auth.get_current_user(token)
+    if user.id != user_id and not user.is_admin:
+        raise HTTPException(
+            status_code=403, detail="You can only see your own loans", headers={"WWW-Authenticate": "Bearer"}
+        )
+    return database.get_user_loans(user_id, before=before, before_id=before_id, limit=limit)
+
 # Branch endpoints -----------------------------------------
 
 
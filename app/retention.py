@@ -0,0 +1,26 @@
+import argparse
+
+from . import database
+
+# Creates the upcoming monthly partitions of the loans table and detaches the
+# ones older than the retention period, meant to be scheduled e.g. daily from cron:
+#   python -m app.retention --retain-months 24
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Create upcoming and detach old partitions of the loans history")
+    parser.add_argument("--retain-months", type=int, default=24,
+                        help="number of full months of loan history to keep attached")
+    parser.add_argument("--drop", action="store_true",
+                        help="drop detached partitions instead of keeping them as standalone tables")
+    args = parser.parse_args()
+
+    database.ensure_loans_partitions()
+    detached = database.detach_old_loans_partitions(
+        args.retain_months, drop=args.drop)
+    print(f"Detached {len(detached)} loans partitions")
+
+
+if __name__ == "__main__":
+    main()
@@ -67,3 +67,12 @@ class Branch(BaseModel):
 class BranchAdd(BaseModel):
     name: str
     location: str
+
+
+class Loan(BaseModel):
+    id: int
+    book_id: int
+    user_id: int
+    borrowed_at: datetime
+    due_at: datetime
+    returned_at: datetime | None
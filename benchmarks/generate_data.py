@@ -0,0 +1,105 @@
+import argparse
+import json
+import random
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+# Generates a synthetic catalog in the format of app/sample_data/*.json, the
+# original sample records are kept and extended with generated ones. Point
+# SAMPLE_DATA_DIR in .env at the output directory before the database is created.
+
+SAMPLE_DATA_DIR = Path(__file__).resolve().parent.parent / "app" / "sample_data"
+
+# every generated user shares the password of the sample user "user"
+BENCH_PASSWORD = "password"
+
+
+def load_sample(name: str) -> list[dict]:
+    with open(SAMPLE_DATA_DIR / f"{name}.json", "r") as f:
+        return json.load(f)
+
+
+def generate_branches(rng: random.Random, count: int) -> list[dict]:
+    branches = load_sample("branches")
+    sample = list(branches)
+    for i in range(len(branches), count):
+        base = rng.choice(sample)
+        branches.append({
+            "id": i + 1,
+            "name": f"{base['name']} - filia {i + 1}",
+            "location": base["location"],
+        })
+    return branches
+
+
+def generate_users(rng: random.Random, count: int) -> list[dict]:
+    users = load_sample("users")
+    sample = list(users)
+    password = next(user["password"] for user in users
+                    if user["username"] == "user")
+    now = datetime.now()
+    for i in range(len(users), count):
+        created = now - timedelta(days=rng.randint(30, 720))
+        users.append({
+            "id": i + 1,
+            "username": f"bench_user_{i + 1}",
+            "email": f"bench_user_{i + 1}@example.com",
+            "name": rng.choice(sample)["name"],
+            "surname": rng.choice(sample)["surname"],
+            "is_admin": False,
+            "is_disabled": False,
+            "date_created": created.isoformat(),
+            "date_updated": created.isoformat(),
+            "password": password,
+        })
+    return users
+
+
+def generate_books(rng: random.Random, count: int, branches: int, users: int, borrowed_ratio: float) -> list[dict]:
+    books = load_sample("books")
+    sample = list(books)
+    today = date.today()
+    for i in range(len(books), count):
+        base = rng.choice(sample)
+        is_borrowed = rng.random() < borrowed_ratio
+        books.append({
+            "title": f"{base['title']} {i // len(sample) + 1}",
+            "author": base["author"],
+            "year": base["year"],
+            "branch": rng.randint(1, branches),
+            "is_borrowed": is_borrowed,
+            "date_borrowed": (today - timedelta(days=rng.randint(0, 60))).isoformat() if is_borrowed else None,
+            "borrowed_by": rng.randint(1, users) if is_borrowed else None,
+            "isbn": "978" + "".join(str(rng.randint(0, 9)) for _ in range(10)),
+        })
+    return books
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic catalog for benchmarking")
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--branches", type=int, default=5)
+    parser.add_argument("--borrowed-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path,
+                        default=Path(__file__).resolve().parent / "data")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    branches = generate_branches(rng, args.branches)
+    users = generate_users(rng, args.users)
+    books = generate_books(rng, args.books, len(branches), len(users),
+                           args.borrowed_ratio)
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    for name, data in (("branches", branches), ("users", users), ("books", books)):
+        with open(args.output / f"{name}.json", "w") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+    print(f"Generated {len(branches)} branches, {len(users)} users and "
+          f"{len(books)} books in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
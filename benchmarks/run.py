@@ -0,0 +1,408 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+from dotenv import dotenv_values
+
+from generate_data import BENCH_PASSWORD
+
+# Drives the API with a few realistic request mixes and reports throughput,
+# latency percentiles and database queries per request. The app is either
+# run in-process (FastAPI TestClient) or reached over HTTP, in both cases
+# against the Postgres database configured in .env.
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+class CountingCursor:
+    # wraps the module level cursor of app.database to count executed queries
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.queries = 0
+
+    def execute(self, *args, **kwargs):
+        self.queries += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class QueryCounter:
+    # counts queries of the whole database using pg_stat_statements, used when
+    # the app runs in another process, None if the extension is not available;
+    # transaction control statements are excluded to match CountingCursor
+    def __init__(self, conninfo: str):
+        import psycopg
+
+        try:
+            self.conn = psycopg.connect(conninfo, autocommit=True)
+            self.conn.execute("CREATE EXTENSION IF NOT EXISTS pg_stat_statements;")
+            self.total()
+        except psycopg.Error as e:
+            print(f"Queries per request not available: {e}")
+            self.conn = None
+
+    def total(self) -> int | None:
+        if not self.conn:
+            return None
+        row = self.conn.execute("""SELECT COALESCE(SUM(calls), 0) FROM pg_stat_statements
+                                WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+                                AND toplevel AND query !~* '^\\s*(BEGIN|COMMIT|ROLLBACK)'
+                                AND query NOT LIKE '%pg_stat_statements%';""").fetchone()
+        return int(row[0])
+
+
+# Request mixes -----------------------------------------
+
+
+def timed(ctx, name, send):
+    # every request is timed and its queries counted on its own
+    counter = ctx["counter"]
+    before = counter.queries if counter else None
+    start = time.perf_counter()
+    response = send()
+    elapsed = time.perf_counter() - start
+    queries = counter.queries - before if counter else None
+    return name, response, elapsed, queries
+
+
+def list_books(client, ctx, rng):
+    return [timed(ctx, "GET /books/", lambda: client.get("/books/"))]
+
+
+def list_branch_books(client, ctx, rng):
+    branch = rng.choice(ctx["branch_ids"])
+    return [timed(ctx, "GET /books/?branch_id", lambda: client.get("/books/", params={"branch_id": branch}))]
+
+
+def get_book(client, ctx, rng):
+    book = rng.choice(ctx["book_ids"])
+    return [timed(ctx, "GET /book/{book_id}/", lambda: client.get(f"/book/{book}/"))]
+
+
+def list_branches(client, ctx, rng):
+    return [timed(ctx, "GET /branches/", lambda: client.get("/branches/"))]
+
+
+def search_books(client, ctx, rng):
+    query = rng.choice(ctx["search_words"])
+    return [timed(ctx, "GET /books/?search_query", lambda: client.get("/books/", params={"search_query": query}))]
+
+
+def borrow_and_return(client, ctx, rng):
+    # only books which were not borrowed in the catalog, each worker has its own
+    # slice of them so the seeded borrowed state is left intact between runs
+    book = rng.choice(ctx["free_book_ids"])
+    headers = {"Authorization": f"Bearer {ctx['token']}"}
+    return [
+        timed(ctx, "PUT /book/{book_id}/borrow/",
+              lambda: client.put(f"/book/{book}/borrow/", headers=headers)),
+        timed(ctx, "PUT /book/{book_id}/return/",
+              lambda: client.put(f"/book/{book}/return/", headers=headers)),
+    ]
+
+
+def login(client, ctx, rng):
+    username = rng.choice(ctx["usernames"])
+    return [timed(ctx, "POST /login/", lambda: client.post("/login/", data={"username": username, "password": BENCH_PASSWORD}))]
+
+
+MIXES = {
+    "browse": [(40, list_books), (40, get_book), (10, list_branches), (10, list_branch_books)],
+    "search": [(70, search_books), (30, get_book)],
+    "borrow": [(100, borrow_and_return)],
+    "login": [(100, login)],
+    "mixed": [(30, get_book), (20, list_branch_books), (20, search_books), (10, list_books),
+              (10, borrow_and_return), (5, login), (5, list_branches)],
+}
+
+
+# Running -----------------------------------------
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float, queries: int | None) -> dict:
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "throughput_rps": count / elapsed if elapsed else None,
+        "mean_ms": sum(latencies) / count * 1000 if count else None,
+        "p50_ms": percentile(latencies, 50) * 1000 if count else None,
+        "p95_ms": percentile(latencies, 95) * 1000 if count else None,
+        "p99_ms": percentile(latencies, 99) * 1000 if count else None,
+        "queries_per_request": queries / count if queries is not None and count else None,
+    }
+
+
+def is_error(response) -> bool:
+    # borrow and return answer `false` with 200 when nothing was changed
+    return response.status_code >= 400 or response.content.strip() == b"false"
+
+
+def run_worker(client, ctx, mix, operations: int, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    weights = [weight for weight, _ in mix]
+    actions = [action for _, action in mix]
+    samples = []
+    for _ in range(operations):
+        action = rng.choices(actions, weights)[0]
+        for name, response, elapsed, queries in action(client, ctx, rng):
+            samples.append({
+                "endpoint": name,
+                "latency": elapsed,
+                "error": is_error(response),
+                "queries": queries,
+            })
+    return samples
+
+
+def worker_context(ctx, counter, worker: int, workers: int) -> dict:
+    return dict(ctx, counter=counter,
+                free_book_ids=ctx["free_book_ids"][worker::workers])
+
+
+def run_mix(name: str, make_client, ctx, args, counter, db_counter) -> dict:
+    mix = MIXES[name]
+    concurrency = args.concurrency
+    clients = [make_client() for _ in range(concurrency)]
+
+    # warm up connections and caches, not measured
+    run_worker(clients[0], worker_context(ctx, None, 0, concurrency),
+               mix, args.warmup, args.seed - 1)
+
+    db_before = db_counter.total() if db_counter else None
+    per_worker = [args.requests // concurrency + (i < args.requests % concurrency)
+                  for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_worker, clients[i],
+                                   worker_context(
+                                       ctx, counter, i, concurrency),
+                                   mix, per_worker[i], args.seed + i)
+                   for i in range(concurrency)]
+        samples = [sample for future in futures for sample in future.result()]
+    elapsed = time.perf_counter() - start
+    db_after = db_counter.total() if db_counter else None
+
+    if counter:
+        total_queries = sum(sample["queries"] for sample in samples)
+    elif db_before is not None and db_after is not None:
+        total_queries = db_after - db_before
+    else:
+        total_queries = None
+
+    endpoints = {}
+    for endpoint in sorted({sample["endpoint"] for sample in samples}):
+        selected = [sample for sample in samples if sample["endpoint"] == endpoint]
+        # queries of single endpoints are only known when counted in-process
+        queries = sum(sample["queries"] for sample in selected) if counter else None
+        endpoints[endpoint] = summarize([sample["latency"] for sample in selected],
+                                        sum(sample["error"] for sample in selected),
+                                        elapsed, queries)
+
+    for client in clients:
+        client.close()
+
+    return {
+        "total": summarize([sample["latency"] for sample in samples],
+                           sum(sample["error"] for sample in samples),
+                           elapsed, total_queries),
+        "endpoints": endpoints,
+    }
+
+
+def prepare_context(client, args) -> dict:
+    books = client.get("/books/").json()
+    branches = client.get("/branches/").json()
+    words = sorted({word for book in books for word in book["title"].split()
+                    if len(word) > 3 and not word.isdigit()})
+    words += sorted({book["author"].split()[-1] for book in books})
+
+    data_dir = args.data if (args.data / "users.json").exists() \
+        else ROOT_DIR / "app" / "sample_data"
+    with open(data_dir / "users.json", "r") as f:
+        usernames = [user["username"] for user in json.load(f)
+                     if user["username"] == "user" or user["username"].startswith("bench_user_")]
+
+    response = client.post(
+        "/login/", data={"username": "user", "password": BENCH_PASSWORD})
+    response.raise_for_status()
+
+    free_book_ids = [book["id"] for book in books if not book["is_borrowed"]]
+    if len(free_book_ids) < args.concurrency:
+        raise SystemExit(
+            "Not enough books which are not borrowed for the borrow mix")
+
+    return {
+        "book_ids": [book["id"] for book in books],
+        "free_book_ids": free_book_ids,
+        "branch_ids": [branch["id"] for branch in branches],
+        "search_words": words,
+        "usernames": usernames,
+        "token": response.json()["access_token"],
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def conninfo(dsn: str | None) -> str:
+    # .env usually points at the compose network (DB_HOST=db), which the host
+    # cannot resolve, so the connection string can be given explicitly
+    if dsn:
+        return dsn
+    env = dotenv_values(".env")
+    return (f"host={env['DB_HOST']} port={env['DB_PORT']} dbname={env['DB_NAME']} "
+            f"user={env['DB_USER']} password={env['DB_PASSWORD']}")
+
+
+def print_report(results: dict, baseline: dict | None) -> None:
+    header = f"{'mix / endpoint':<36}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'q/req':>8}{'err':>6}"
+    if baseline:
+        header += f"{'req/s diff':>12}{'p95 diff':>10}"
+    print(header)
+
+    def fmt(value, width, digits=1):
+        return f"{value:>{width}.{digits}f}" if value is not None else f"{'-':>{width}}"
+
+    def diff(new, old):
+        if new is None or not old:
+            return f"{'-':>10}"
+        return f"{(new - old) / old * 100:>+9.1f}%"
+
+    for mix, result in results["mixes"].items():
+        rows = [(mix, result["total"])] + \
+            [(f"  {endpoint}", stats) for endpoint, stats in result["endpoints"].items()]
+        for label, stats in rows:
+            line = (f"{label:<36}{fmt(stats['throughput_rps'], 10)}{fmt(stats['p50_ms'], 10, 2)}"
+                    f"{fmt(stats['p95_ms'], 10, 2)}{fmt(stats['p99_ms'], 10, 2)}"
+                    f"{fmt(stats['queries_per_request'], 8, 2)}{stats['errors']:>6}")
+            if baseline:
+                old = baseline["mixes"].get(mix, {})
+                old = old.get("total") if label == mix else old.get(
+                    "endpoints", {}).get(label.strip())
+                old = old or {}
+                line += f"  {diff(stats['throughput_rps'], old.get('throughput_rps'))}" \
+                    f"{diff(stats['p95_ms'], old.get('p95_ms'))}"
+            print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the library API")
+    parser.add_argument("--mode", choices=["inprocess", "http"], default="inprocess",
+                        help="run the app in this process or send requests to --url")
+    parser.add_argument("--url", default="http://localhost:80")
+    parser.add_argument("--mix", choices=list(MIXES), action="append",
+                        help="request mix to run, can be repeated, all mixes by default")
+    parser.add_argument("--requests", type=int, default=1000,
+                        help="number of measured operations per mix")
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="number of concurrent clients, in-process mode always uses 1")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--data", type=Path, default=Path(__file__).resolve().parent / "data",
+                        help="directory of the generated catalog, used to pick users for logins")
+    parser.add_argument("--output", type=Path,
+                        help="where to save results, benchmarks/results/<timestamp>.json by default")
+    parser.add_argument("--dsn",
+                        help="connection string of the database for counting queries in http mode, "
+                        "e.g. \"host=localhost port=5432 dbname=library_system user=postgres password=secret\", "
+                        "built from .env by default")
+    parser.add_argument("--compare", type=Path,
+                        help="results of a previous run to compare against")
+    args = parser.parse_args()
+
+    # in-process requests share one connection and cursor, so they run one at a time
+    if args.mode == "inprocess":
+        args.concurrency = 1
+
+    # the app reads .env from the working directory
+    args.data = args.data.resolve()
+    args.output = args.output.resolve() if args.output else None
+    args.compare = args.compare.resolve() if args.compare else None
+    os.chdir(ROOT_DIR)
+
+    counter = None
+    db_counter = None
+    if args.mode == "inprocess":
+        sys.path.insert(0, str(ROOT_DIR))
+        from fastapi.testclient import TestClient
+        from app import database
+        from app.main import app
+
+        counter = CountingCursor(database.cur)
+        database.cur = counter
+
+        def make_client():
+            return TestClient(app)
+    else:
+        db_counter = QueryCounter(conninfo(args.dsn))
+
+        def make_client():
+            return httpx.Client(base_url=args.url, timeout=30)
+
+    setup_client = make_client()
+    ctx = prepare_context(setup_client, args)
+    setup_client.close()
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git_commit": git_commit(),
+            "mode": args.mode,
+            "url": args.url if args.mode == "http" else None,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "books": len(ctx["book_ids"]),
+            "branches": len(ctx["branch_ids"]),
+            "login_users": len(ctx["usernames"]),
+            "queries_counted": "cursor executes of app.database" if args.mode == "inprocess"
+            else "pg_stat_statements calls, excluding BEGIN/COMMIT/ROLLBACK",
+        },
+        "mixes": {},
+    }
+    for mix in args.mix or list(MIXES):
+        print(f"Running mix {mix}...")
+        results["mixes"][mix] = run_mix(
+            mix, make_client, ctx, args, counter, db_counter)
+
+    output = args.output or ROOT_DIR / "benchmarks" / "results" / \
+        f"{datetime.now():%Y%m%d_%H%M%S}_{args.mode}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=4)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()